@@ -29,29 +29,49 @@
 # - Scikit-learn: To create a predictive model
 # - [us](https://github.com/unitedstates/python-us): Detailed state information
 # %%
+from pathlib import Path
 import statsmodels.api as sm
 from numpy.core.fromnumeric import mean
 from numpy.lib.function_base import average
 import pandas as pd
 import numpy as np
+import matplotlib as mpl
 import matplotlib.pyplot as plt
 import seaborn as sns
 import us
 import sklearn
 from sklearn.linear_model import LinearRegression
+
+# the state charts are large, so render them at screen resolution
+mpl.rcParams.update(
+    {"figure.dpi": 72, "savefig.dpi": 100, "path.simplify_threshold": 1.0})
 # %% [markdown]
 # ## 3. Data Wrangling
 # %% [markdown]
 # ### 3.1. Introduction to Datasets
+# Both datasets are CSV files, which are slow to parse. The first time a file is read we'll save a parquet copy of it next to the CSV and read that copy on every run after.
+# %%
+def parquetCopy(csv):
+    """Returns the path of a parquet copy of the raw csv, rebuilding it if it's missing or older than csv.
+
+    No read options are baked into the copy, so parse dates and cast dtypes after reading it."""
+    path = Path(csv).with_suffix(".parquet")
+    if not path.exists() or path.stat().st_mtime < Path(csv).stat().st_mtime:
+        pd.read_csv(csv, engine="pyarrow").to_parquet(path)
+    return path
+
+
 # %% [markdown]
 # #### 3.1.1. Election Data
 # For election data, we'll be using data from the [MIT Election Data and Science Lab](https://electionlab.mit.edu/data) for 2020 election results. This lab focusing on collecting and analyzing election data to apply scientific research to the democracy of the United States.
 #
 # MIT Election Data and Science Lab, 2017, "U.S. President 1976–2020", https://doi.org/10.7910/DVN/42MVDX, Harvard Dataverse, V6, UNF:6:4KoNz9KgTkXy0ZBxJ9ZkOw==
 # %%
-elections = pd.read_csv("./data/1976-2020-president.csv")
-# remove all other years except 2020
-elections = elections[elections["year"] == 2020]
+# only the 2020 rows and the columns we need are read from the parquet copy
+elections = pd.read_parquet(parquetCopy("./data/1976-2020-president.csv"),
+                            columns=["state", "candidatevotes",
+                                     "totalvotes", "party_simplified"],
+                            filters=[("year", "==", 2020)])
 elections.head()
 # %% [markdown]
 # #### 3.1.2. Vaccination Data
@@ -59,69 +79,66 @@ elections.head()
 #
 # Mathieu, E., Ritchie, H., Ortiz-Ospina, E. et al. A global database of COVID-19 vaccinations. Nat Hum Behav (2021). https://doi.org/10.1038/s41562-021-01122-8
 # %%
-vaccinations = pd.read_csv("./data/us_state_vaccinations.csv")
+# the rates only have a few significant digits, so single precision is plenty
+# (people_fully_vaccinated_per_hundred stays double since it feeds the regression)
+rates = ["total_vaccinations_per_hundred", "people_vaccinated_per_hundred",
+         "distributed_per_hundred", "daily_vaccinations_per_million", "share_doses_used"]
+vaccinations = pd.read_parquet(parquetCopy("./data/us_state_vaccinations.csv")).astype(
+    {rate: "float32" for rate in rates})
+vaccinations["date"] = pd.to_datetime(vaccinations["date"])
 vaccinations.info()
 # %% [markdown]
 # ### 3.2. Tidying the Data
 # %% [markdown]
-# There's some columns in the election dataset that we don't need, so we're going to get rid of those.
+# The state, location, and party columns only have a few dozen distinct values, so we'll store them as categories to make grouping and joining on them cheaper.
 # %%
-elections = pd.DataFrame(
-    elections[["state", "candidatevotes", "totalvotes", "party_simplified"]])
-elections.head()
+elections["state"] = elections["state"].astype("category")
+elections["party_simplified"] = elections["party_simplified"].astype(
+    "category")
+vaccinations["location"] = vaccinations["location"].astype("category")
 # %% [markdown]
 # Let's also calculate the party that had the most votes for each state to use later.
 # %%
-idx = elections.groupby(["state"])["candidatevotes"].transform(
-    max) == elections["candidatevotes"]
-majority = elections[idx][["state", "party_simplified"]].rename(
-    columns={"party_simplified": "p"})
-elections["majority_party"] = majority["p"]
+majority = elections.loc[elections.groupby("state", observed=True)["candidatevotes"].idxmax(), [
+    "state", "party_simplified"]].rename(columns={"party_simplified": "p"})
+elections["majority_party"] = majority["p"].astype(str)
 elections.head()
 # %% [markdown]
 # Now we need to combine every state into one row so it's easier to use and rename the state column to location to match the vaccination dataset.
 # %%
-for i, row in elections.iterrows():
-    elections.at[i, row["party_simplified"] +
-                 "_percent"] = row["candidatevotes"]/row["totalvotes"]*100
-elections = elections.groupby("state").first().drop(
-    columns=["party_simplified", "candidatevotes"]).reset_index().rename(columns={"state": "location"})
+elections["percent"] = elections.eval("candidatevotes / totalvotes * 100")
+percents = elections.pivot_table(index="state", columns="party_simplified",
+                                 values="percent", aggfunc="first", observed=True).add_suffix("_percent")
+elections = elections.groupby("state", observed=True)[["totalvotes", "majority_party"]].first().join(
+    percents).rename_axis(columns=None).reset_index().rename(columns={"state": "location"})
+elections["location"] = elections["location"].str.title().replace(
+    {"New York": "New York State"})
 elections.head()
 # %% [markdown]
-# For vaccination data, we need to remove federal entities like the *Dept of Defense* to ensure the dataset is only states. Also, make sure that dates are in datetime format.
+# For vaccination data, we need to remove federal entities like the *Dept of Defense* to ensure the dataset is only states.
 # %%
-states = [state.name for state in us.STATES]
-states.append("New York State")
-vaccinations = pd.DataFrame(
-    vaccinations[vaccinations["location"].isin(states)])
-vaccinations["date"] = pd.to_datetime(vaccinations["date"])
+states = frozenset(state.name for state in us.STATES) | {"New York State"}
+vaccinations = vaccinations[vaccinations["location"].isin(states)].assign(
+    location=lambda df: df["location"].cat.remove_unused_categories())
 # %% [markdown]
 # Now let's add the election data to the vaccination dataset.
 # %%
-for i, row in vaccinations.iterrows():
-    location = row["location"].upper()
-    if (location == "NEW YORK STATE"):
-        location = "NEW YORK"
-    stateElection = elections[elections["location"] == location]
-    party = stateElection["majority_party"].iloc[0]
-    vaccinations.at[i,
-                    "DEMOCRAT_percent"] = stateElection["DEMOCRAT_percent"].iloc[0]
-    vaccinations.at[i, "party"] = party
-    color = "green"
-    if (party == "REPUBLICAN"):
-        color = "red"
-    elif (party == "DEMOCRAT"):
-        color = "blue"
-    vaccinations.at[i, "color"] = color
-colors = vaccinations[["location", "color"]].set_index("location").to_dict()[
-    "color"]
+# only keep results for states in the vaccination data (this drops the District of Columbia)
+elections = elections[elections["location"].isin(
+    vaccinations["location"].cat.categories)]
+vaccinations = vaccinations.merge(elections[["location", "DEMOCRAT_percent", "majority_party"]].astype(
+    {"location": vaccinations["location"].dtype}).rename(columns={"majority_party": "party"}), on="location", how="left")
+assert vaccinations["party"].notna().all(), "every state should have election results"
+partyColors = {"REPUBLICAN": "red", "DEMOCRAT": "blue"}
+vaccinations["color"] = vaccinations["party"].map(partyColors).fillna("green")
+colors = dict(zip(elections["location"],
+              elections["majority_party"].map(partyColors).fillna("green")))
 vaccinations.head()
 # %% [markdown]
 # Next, we need to make a dataset that contains the most recent data entry for convenience.
 # %%
-idx = vaccinations.groupby("location")["date"].transform(
-    max) == vaccinations["date"]
-recentVax = vaccinations[idx]
+recentVax = vaccinations.sort_values("date").groupby(
+    "location", observed=True).tail(1)
 recentVax.info()
 # %% [markdown]
 # ## 4. Exploratory Data Analysis
@@ -131,7 +148,7 @@ recentVax = recentVax.sort_values(
     by=["people_fully_vaccinated"], ascending=False)
 plt.figure(figsize=(8, 32))
 sns.barplot(y=recentVax["location"],
-            x=recentVax["people_fully_vaccinated"], palette=colors)
+            x=recentVax["people_fully_vaccinated"], order=recentVax["location"], palette=colors)
 plt.xlabel("People Fully Vaccinated")
 plt.ylabel("State")
 plt.title("People Fully Vaccinated By State")
@@ -145,7 +162,7 @@ recentVax = recentVax.sort_values(
     by=["people_fully_vaccinated_per_hundred"], ascending=False)
 plt.figure(figsize=(8, 32))
 sns.barplot(y=recentVax["location"],
-            x=recentVax["people_fully_vaccinated_per_hundred"], palette=colors)
+            x=recentVax["people_fully_vaccinated_per_hundred"], order=recentVax["location"], palette=colors)
 plt.xlabel("People Fully Vaccinated per 100 People")
 plt.ylabel("State")
 plt.title("People Fully Vaccinated Per 100 People By State")
@@ -155,29 +172,25 @@ plt.show()
 # %% [markdown]
 # Now, let's take a look at the rate at which each state administered the vaccination.
 # %%
-vaccinations.pivot(index="date", columns="location",
-                   values="daily_vaccinations_per_million").plot(subplots=True, sharey=True, layout=(10, 5), figsize=(25, 25), color=colors)
-plt.ylabel("People Vaccinated Per Million")
-plt.xlabel("Day")
+# each state has one row per date, so there's nothing to aggregate
+g = sns.relplot(data=vaccinations, x="date", y="daily_vaccinations_per_million", col="location", col_wrap=5,
+                hue="location", palette=colors, kind="line", estimator=None, errorbar=None, legend=False,
+                height=2.5, aspect=2, facet_kws=dict(sharey=True), rasterized=True)
+g.set_titles("{col_name}")
+g.set_axis_labels("Day", "People Vaccinated Per Million")
+g.figure.autofmt_xdate()
 plt.show()
 # %% [markdown]
 # The above chart shows that a lot of the charts start off as an incline and then taper off about 75% of the way through. Some states like New Hampshire had bursts of increases and Maine appears to be increasing steadily. Let's pick some of the interesting charts and look at them a bit closer.
 # %%
 fig, ax = plt.subplots()
-# Republican states
-vaccinations.query("location == 'Florida'").plot(
-    x="date", y="daily_vaccinations_per_million", ax=ax, linestyle="dashed", label="Florida")
-vaccinations.query("location == 'Ohio'").plot(
-    x="date", y="daily_vaccinations_per_million", ax=ax, linestyle="dashed", label="Ohio")
-vaccinations.query("location == 'South Dakota'").plot(
-    x="date", y="daily_vaccinations_per_million", ax=ax, linestyle="dashed", label="South Dakota")
-# Democrat states
-vaccinations.query("location == 'Maine'").plot(
-    x="date", y="daily_vaccinations_per_million", ax=ax, label="Maine")
-vaccinations.query("location == 'New Hampshire'").plot(
-    x="date", y="daily_vaccinations_per_million", ax=ax, label="New Hampshire")
-vaccinations.query("location == 'Vermont'").plot(
-    x="date", y="daily_vaccinations_per_million", ax=ax, label="Vermont")
+republicanStates = ["Florida", "Ohio", "South Dakota"]
+democratStates = ["Maine", "New Hampshire", "Vermont"]
+picked = vaccinations[vaccinations["location"].isin(
+    republicanStates + democratStates)].groupby("location", observed=True)
+for state in republicanStates + democratStates:
+    picked.get_group(state).plot(x="date", y="daily_vaccinations_per_million", ax=ax,
+                                 linestyle="dashed" if state in republicanStates else "solid", label=state)
 plt.ylabel("People Vaccinated Per Million")
 plt.xlabel("Day")
 plt.title("(Dashed = Republican)")
@@ -188,14 +201,18 @@ plt.show()
 # 
 # Let's group them together to make this a little easier to see.
 # %%
-maxVax = vaccinations.groupby("location").agg(max)
+maxVax = vaccinations.groupby("location", observed=True).agg(
+    {"people_fully_vaccinated_per_hundred": "max", "DEMOCRAT_percent": "first", "party": "first"})
 plt.figure()
-x = maxVax["people_fully_vaccinated_per_hundred"]
-y = maxVax["DEMOCRAT_percent"]
+x = maxVax["people_fully_vaccinated_per_hundred"].to_numpy(dtype="float32")
+y = maxVax["DEMOCRAT_percent"].to_numpy(dtype="float32")
 sns.scatterplot(data=maxVax, x="people_fully_vaccinated_per_hundred",
                 y="DEMOCRAT_percent", hue="party", palette=["red", "blue"])
 # plt.scatter(x, y, alpha=0.7, c="Animation", colormap="jet")
-m, b = np.polyfit(x, y, 1)
+# least squares line: slope = cov(x, y) / var(x)
+xDev = x - x.mean()
+m = (xDev*(y - y.mean())).sum()/(xDev**2).sum()
+b = y.mean() - m*x.mean()
 plt.plot(x, m*x + b, color="red")
 plt.ylabel("Democratic Vote %")
 plt.xlabel("People Fully Vaccinated per Hundred")